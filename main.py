@@ -1,14 +1,20 @@
 #!/usr/bin/env python3
+import asyncio
 import logging
-import json
 import os
 import re
-import sqlite3
-from contextlib import contextmanager
-from typing import Optional, Tuple, Dict
+import tempfile
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from types import MappingProxyType
+from typing import BinaryIO, Optional, Set, Tuple, Dict
 
-from aiohttp import ClientSession, FormData
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+import aiosqlite
+import orjson
+from aiosqlitepool import SQLiteConnectionPool
+from aiohttp import ClientSession, ClientTimeout, FormData, TCPConnector
+from telegram import Update, CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup, InputFile
+from telegram.error import TelegramError
 from telegram.ext import (
     Application,
     CommandHandler,
@@ -17,7 +23,7 @@ from telegram.ext import (
     ContextTypes,
     CallbackQueryHandler
 )
-from openai import OpenAI
+from openai import AsyncOpenAI
 
 # Enable logging
 logging.basicConfig(
@@ -29,17 +35,151 @@ logger.info("Running DreamVillaBot")
 # Database configuration
 DATABASE_PATH = "villa_data.db"
 
+# Maximum number of users kept in the in-memory preference cache
+USER_CACHE_SIZE = 10_000
+
+# Per-connection tuning; journal_mode=WAL is persistent and set once in _setup_database
+CONNECTION_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-20000",
+)
+
+# Writable columns of the user_preferences table
+PREFERENCE_COLUMNS = frozenset({"budget", "location", "style", "camera_angle"})
+
+# Budget description mapping
+BUDGET_DESC = MappingProxyType({
+    "100k-200k": "budget-friendly",
+    "200k-300k": "standard",
+    "300k-500k": "premium",
+    "500k-750k": "luxury",
+    "750k-1m": "ultra-luxury",
+    "1m-plus": "elite high-end"
+})
+
+# Camera angle description mapping
+ANGLE_DESC = MappingProxyType({
+    "orbit": "aerial 360-degree view around a",
+    "top-down": "top-down aerial view of a",
+    "approach": "front approach view of a",
+    "flyover": "low flyover shot of a",
+    "parallax": "parallax arc shot of a"
+})
+
+# Upper bound in seconds for the /info API health probe
+API_PROBE_TIMEOUT = 2.0
+API_PROBE_MARGIN = 0.5
+
+# Prompt enhancement messages; ENHANCE_PROMPT_TEMPLATE is filled with str.format(prompt=...)
+ENHANCE_SYSTEM_PROMPT = (
+    "You are an artificial intelligence assistant and you need to "
+    "engage in a helpful, detailed, polite conversation with a user."
+)
+
+ENHANCE_PROMPT_TEMPLATE = (
+    "You are an AI assistant tasked with processing messages from a Telegram channel and generating Stable Diffusion prompts based on the content. Each message contains a text input. Your job is to analyze the text input and create a prompt that will create an original photo using Stable Diffusion."
+    "You work on architecture project, keep in mind your results will be shown to final customers and architect teams."
+    "Emphasis on lightness of structures."
+    "You will receive a text input:"
+    "<text_input>{prompt}</text_input>"
+    "Follow these steps to process the input and generate a Stable Diffusion prompt:"
+    "1. Interpret the prompt:"
+    "   - Identify key words, themes, or concepts mentioned in the legend."
+    "   - Determine the mood, tone, or atmosphere suggested by the text."
+    "2. Generate a Stable Diffusion prompt:"
+    "   - Incorporate elements from the legend to guide the modification or enhancement of the image."
+    "   - Use specific, descriptive language to convey the desired style, mood, and visual elements."
+    "   - Include any relevant techniques, or references that align with the legend and original photo."
+    "3. Refine and optimize the prompt:"
+    "   - Ensure the prompt is clear, concise, and focused."
+    "   - Use Stable Diffusion-friendly terminology and structure."
+    "   - Balance faithfulness to the original photo with creative interpretation of the legend."
+    "4. Give a title for the work you have done:"
+    "   - the title should explain in 5-10 words what will be visible on the image."
+    "   - the title will be used as the caption for the generated image."
+    "   - try to be funny, but don't overthink it: you are a clown that can make serious people laugh!"
+    "Provide your output in the following format:"
+    "<result><analysis>"
+    "[Your analysis of the text_input]"
+    "</analysis>"
+    "<stable_diffusion_prompt>"
+    "[Your generated Stable Diffusion prompt]"
+    "</stable_diffusion_prompt>"
+    "<title>"
+    "[Your generated Title for this work]"
+    "</title></result>"
+    "Check that the <stable_diffusion_prompt> and <title> tags are available inside the response <result> tag."
+)
+
+# Last row of the home screen keyboard, identical for every user
+GENERATE_ROW = (InlineKeyboardButton("🔄 Generate Villa", callback_data="action:generate"),)
+
+# Budget selection buttons
+BUDGET_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("$100K-$200K (Budget)", callback_data="budget:100k-200k")],
+    [InlineKeyboardButton("$200K-$300K (Standard)", callback_data="budget:200k-300k")],
+    [InlineKeyboardButton("$300K-$500K (Premium)", callback_data="budget:300k-500k")],
+    [InlineKeyboardButton("$500K-$750K (Luxury)", callback_data="budget:500k-750k")],
+    [InlineKeyboardButton("$750K-$1M (Ultra-Luxury)", callback_data="budget:750k-1m")],
+    [InlineKeyboardButton("$1M+ (Elite)", callback_data="budget:1m-plus")],
+    [InlineKeyboardButton("« Back to Home", callback_data="action:home")]
+])
+
+# Location selection buttons
+LOCATION_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("Seaside", callback_data="location:seaside")],
+    [InlineKeyboardButton("Jungle", callback_data="location:jungle")],
+    [InlineKeyboardButton("Mountain", callback_data="location:mountain")],
+    [InlineKeyboardButton("Urban", callback_data="location:urban")],
+    [InlineKeyboardButton("« Back to Home", callback_data="action:home")]
+])
+
+# Style selection buttons
+STYLE_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("Modern", callback_data="style:modern")],
+    [InlineKeyboardButton("Rustic/Wood", callback_data="style:rustic")],
+    [InlineKeyboardButton("Mediterranean", callback_data="style:mediterranean")],
+    [InlineKeyboardButton("Minimalist", callback_data="style:minimalist")],
+    [InlineKeyboardButton("« Back to Home", callback_data="action:home")]
+])
+
+# Camera angle selection buttons
+CAMERA_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("Orbit (360° around property)", callback_data="camera_angle:orbit")],
+    [InlineKeyboardButton("Top-Down (Aerial view)", callback_data="camera_angle:top-down")],
+    [InlineKeyboardButton("Front Approach", callback_data="camera_angle:approach")],
+    [InlineKeyboardButton("Flyover (Low pass)", callback_data="camera_angle:flyover")],
+    [InlineKeyboardButton("Parallax Arc", callback_data="camera_angle:parallax")],
+    [InlineKeyboardButton("« Back to Home", callback_data="action:home")]
+])
+
+# Read size when streaming generated images from the API, and the upload filename
+IMAGE_CHUNK_SIZE = 64 * 1024
+IMAGE_FILENAME = "villa.png"
+
+# Tags extracted from the prompt enhancement response
+PROMPT_RE = re.compile(r'<stable_diffusion_prompt>(.*?)</stable_diffusion_prompt>', re.DOTALL)
+TITLE_RE = re.compile(r'<title>(.*?)</title>', re.DOTALL)
+
 # Configuration management
 class Config:
     def __init__(self, config_file="config.json"):
         self.config_data = self._load_config(config_file)
         
+        # Cache frequently accessed values
+        self._bot_token = self.config_data.get("bot_token")
+        self._api_url = self.config_data.get("api_url")
+        self._api_methods = self.config_data.get("api_methods", {})
+        self._messages = self.config_data.get("messages", {})
+        
     def _load_config(self, config_file: str) -> dict:
         if not os.path.exists(config_file):
             raise OSError(f"❌ Config file not found: {config_file}")
 
-        with open(config_file, 'r') as f:
-            config = json.load(f)
+        with open(config_file, 'rb') as f:
+            config = orjson.loads(f.read())
 
         if "telegram_bot" not in config:
             logger.error(f"❌ telegram_bot not available in config file: {config}")
@@ -52,30 +192,54 @@ class Config:
     
     @property
     def bot_token(self):
-        return self.config_data.get("bot_token")
+        return self._bot_token
     
     @property
     def api_url(self):
-        return self.config_data.get("api_url")
+        return self._api_url
     
     @property
     def api_methods(self):
-        return self.config_data.get("api_methods", {})
+        return self._api_methods
     
     @property
     def messages(self):
-        return self.config_data.get("messages", {})
+        return self._messages
 
 # Database manager
 class DatabaseManager:
-    def __init__(self, db_path=DATABASE_PATH):
+    def __init__(self, db_path=DATABASE_PATH, pool_size=5, cache_size=USER_CACHE_SIZE):
         self.db_path = db_path
-        self._setup_database()
+        self.pool_size = pool_size
+        self.pool: Optional[SQLiteConnectionPool] = None
+        
+        # Write-through LRU cache so button callbacks don't read SQLite
+        self.cache_size = cache_size
+        self._pref_cache: OrderedDict[int, Dict[str, str]] = OrderedDict()
+    
+    async def setup(self):
+        """Create the connection pool and make sure the tables exist."""
+        self.pool = SQLiteConnectionPool(self._connection_factory, pool_size=self.pool_size)
+        await self._setup_database()
     
-    def _setup_database(self):
-        with self._get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
+    async def close(self):
+        if self.pool:
+            await self.pool.close()
+            self.pool = None
+    
+    async def _connection_factory(self) -> aiosqlite.Connection:
+        conn = await aiosqlite.connect(self.db_path)
+        for pragma in CONNECTION_PRAGMAS:
+            await conn.execute(pragma)
+        return conn
+    
+    async def _setup_database(self):
+        async with self.pool.connection() as conn:
+            # WAL lets readers and the writer proceed without blocking each other
+            await conn.execute("PRAGMA journal_mode=WAL")
+        
+        async with self.transaction() as conn:
+            await conn.execute('''
             CREATE TABLE IF NOT EXISTS image_data (
                 message_id INTEGER PRIMARY KEY,
                 photo_file_id TEXT,
@@ -83,152 +247,195 @@ class DatabaseManager:
                 likes INTEGER DEFAULT 0
             )
             ''')
-            cursor.execute('''
+            await conn.execute('''
             CREATE TABLE IF NOT EXISTS user_preferences (
                 user_id INTEGER PRIMARY KEY,
                 budget TEXT DEFAULT '300k-500k',
                 location TEXT DEFAULT 'seaside',
                 style TEXT DEFAULT 'modern',
-                camera_angle TEXT DEFAULT 'orbit',
-                current_step TEXT
+                camera_angle TEXT DEFAULT 'orbit'
             )
             ''')
-            conn.commit()
     
-    @contextmanager
-    def _get_connection(self):
-        conn = sqlite3.connect(self.db_path)
-        try:
-            yield conn
-        finally:
-            conn.close()
+    @asynccontextmanager
+    async def transaction(self):
+        """Group several writes into one BEGIN IMMEDIATE transaction with a single commit.
+        
+        Single-statement writes don't need this; they commit their implicit transaction.
+        """
+        async with self.pool.connection() as conn:
+            await conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                try:
+                    await conn.rollback()
+                except Exception as e:
+                    logger.error(f"Error rolling back transaction: {e}")
+                raise
+            await conn.commit()
     
-    def save_image_data(self, message_id: int, photo_file_id: str, legend: Optional[str]) -> int:
-        with self._get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
+    async def save_image_data(self, message_id: int, photo_file_id: str, legend: Optional[str]) -> int:
+        async with self.pool.connection() as conn:
+            cursor = await conn.execute('''
             INSERT INTO image_data (message_id, photo_file_id, legend)
             VALUES (?, ?, ?)
             ''', (message_id, photo_file_id, legend))
             row_id = cursor.lastrowid
-            conn.commit()
+            await conn.commit()
             return row_id
     
-    def get_image_data(self, row_id: int) -> Optional[Tuple[str, str]]:
-        with self._get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT photo_file_id, legend FROM image_data WHERE rowid = ?', (row_id,))
-            return cursor.fetchone()
-    
-    def like_image(self, row_id: int) -> int:
-        with self._get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute('UPDATE image_data SET likes = likes + 1 WHERE rowid = ?', (row_id,))
-            conn.commit()
-            cursor.execute('SELECT likes FROM image_data WHERE rowid = ?', (row_id,))
-            result = cursor.fetchone()
+    async def get_image_data(self, row_id: int) -> Optional[Tuple[str, str]]:
+        async with self.pool.connection() as conn:
+            cursor = await conn.execute('SELECT photo_file_id, legend FROM image_data WHERE message_id = ?', (row_id,))
+            return await cursor.fetchone()
+    
+    async def like_image(self, row_id: int) -> int:
+        async with self.pool.connection() as conn:
+            cursor = await conn.execute(
+                'UPDATE image_data SET likes = likes + 1 WHERE message_id = ? RETURNING likes',
+                (row_id,)
+            )
+            result = await cursor.fetchone()
+            await conn.commit()
             return result[0] if result else 0
     
-    def get_user_preferences(self, user_id: int) -> Dict[str, str]:
-        with self._get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute(
+    async def get_user_preferences(self, user_id: int) -> Dict[str, str]:
+        cached = self._pref_cache.get(user_id)
+        if cached is not None:
+            self._pref_cache.move_to_end(user_id)
+            return dict(cached)
+        
+        async with self.pool.connection() as conn:
+            cursor = await conn.execute(
                 'SELECT budget, location, style, camera_angle FROM user_preferences WHERE user_id = ?', 
                 (user_id,)
             )
-            result = cursor.fetchone()
-            
-            if not result:
-                # Initialize with defaults if no preferences exist
-                return {
-                    "budget": "300k-500k",
-                    "location": "seaside",
-                    "style": "modern",
-                    "camera_angle": "orbit"
-                }
-            else:
-                return {
-                    "budget": result[0],
-                    "location": result[1],
-                    "style": result[2],
-                    "camera_angle": result[3]
-                }
-    
-    def update_user_preference(self, user_id: int, preference_type: str, value: str) -> None:
-        with self._get_connection() as conn:
-            cursor = conn.cursor()
-            # Try to update first
-            cursor.execute(
-                f'UPDATE user_preferences SET {preference_type} = ? WHERE user_id = ?', 
-                (value, user_id)
-            )
-            # If no rows affected, do an insert
-            if cursor.rowcount == 0:
-                fields = ["user_id", preference_type]
-                values = [user_id, value]
-                placeholders = ["?"] * len(fields)
-                
-                query = f'''
-                INSERT INTO user_preferences ({", ".join(fields)})
-                VALUES ({", ".join(placeholders)})
-                '''
-                cursor.execute(query, values)
-            conn.commit()
-    
-    def update_user_step(self, user_id: int, step: str) -> None:
-        with self._get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                'UPDATE user_preferences SET current_step = ? WHERE user_id = ?', 
-                (step, user_id)
+            result = await cursor.fetchone()
+        
+        if not result:
+            # Initialize with defaults if no preferences exist
+            prefs = {
+                "budget": "300k-500k",
+                "location": "seaside",
+                "style": "modern",
+                "camera_angle": "orbit"
+            }
+        else:
+            prefs = self._row_to_preferences(result)
+        
+        # A concurrent write may have cached a fresher row while we were reading
+        if user_id not in self._pref_cache:
+            self._cache_put(user_id, prefs)
+        return dict(self._pref_cache.get(user_id, prefs))
+    
+    async def update_user_preference(self, user_id: int, preference_type: str, value: str) -> None:
+        # Column names can't be bound as parameters, so only known columns are interpolated
+        if preference_type not in PREFERENCE_COLUMNS:
+            raise ValueError(f"Unknown preference type: {preference_type}")
+        
+        async with self.pool.connection() as conn:
+            cursor = await conn.execute(
+                f'''
+                INSERT INTO user_preferences (user_id, {preference_type}) VALUES (?, ?)
+                ON CONFLICT(user_id) DO UPDATE SET {preference_type} = excluded.{preference_type}
+                RETURNING budget, location, style, camera_angle
+                ''',
+                (user_id, value)
             )
-            # If no rows affected, insert a new record
-            if cursor.rowcount == 0:
-                cursor.execute(
-                    'INSERT INTO user_preferences (user_id, current_step) VALUES (?, ?)',
-                    (user_id, step)
-                )
-            conn.commit()
+            result = await cursor.fetchone()
+            await conn.commit()
+        
+        # Write-through: the returned row is authoritative for this user
+        self._cache_put(user_id, self._row_to_preferences(result))
+    
+    @staticmethod
+    def _row_to_preferences(row: Tuple[str, str, str, str]) -> Dict[str, str]:
+        return {
+            "budget": row[0],
+            "location": row[1],
+            "style": row[2],
+            "camera_angle": row[3]
+        }
+    
+    def _cache_put(self, user_id: int, prefs: Dict[str, str]) -> None:
+        """Cache a user's preferences, evicting the least recently used users past the size cap."""
+        self._pref_cache[user_id] = prefs
+        self._pref_cache.move_to_end(user_id)
+        while len(self._pref_cache) > self.cache_size:
+            self._pref_cache.popitem(last=False)
 
 # API client
 class ApiClient:
     def __init__(self, config: Config):
         self.config = config
         self.perplexity_client = None
+        self.session: Optional[ClientSession] = None
         
         # Initialize API client
         if config.get("PERPLEXITY_API_KEY"):
-            self.perplexity_client = OpenAI(
+            self.perplexity_client = AsyncOpenAI(
                 api_key=config.get("PERPLEXITY_API_KEY"),
                 base_url="https://api.perplexity.ai"
             )
             logger.info("Perplexity client initialized")
     
+    async def ensure_session(self) -> ClientSession:
+        """Return the shared HTTP session, creating it on first use."""
+        if self.session is None or self.session.closed:
+            self.session = ClientSession(
+                connector=TCPConnector(limit=100, ttl_dns_cache=300),
+                timeout=ClientTimeout(total=120)
+            )
+        return self.session
+    
+    async def close(self) -> None:
+        if self.session and not self.session.closed:
+            await self.session.close()
+        self.session = None
+        if self.perplexity_client:
+            await self.perplexity_client.close()
+    
     async def is_api_online(self) -> bool:
         try:
-            async with ClientSession() as session:
-                prompts_url = f"{self.config.api_url}{self.config.api_methods.get('prompts', '')}"
-                async with session.get(prompts_url) as response:
-                    return response.status == 200
+            session = await self.ensure_session()
+            prompts_url = f"{self.config.api_url}{self.config.api_methods.get('prompts', '')}"
+            async with session.get(prompts_url, timeout=ClientTimeout(total=API_PROBE_TIMEOUT)) as response:
+                return response.status == 200
+        except asyncio.TimeoutError:
+            logger.error(f"API probe timed out after {API_PROBE_TIMEOUT}s")
+            return False
         except Exception as e:
             logger.error(f"Error checking API url: {e}")
             return False
     
-    async def generate_image(self, prompt: str) -> Optional[bytes]:
-        """Generate an image using the provided prompt."""
+    async def generate_image(self, prompt: str) -> Optional[BinaryIO]:
+        """Generate an image using the provided prompt.
+        
+        The response is copied in chunks into a temporary file so it can be uploaded
+        to Telegram as a stream; the caller is responsible for closing it.
+        """
         try:
-            async with ClientSession() as session:
-                prompt_data = FormData()
-                prompt_data.add_field('prompt-text', prompt)
-                gen_url = f"{self.config.api_url}{self.config.api_methods.get('gen', '')}"
-                async with session.post(
-                    gen_url,
-                    data=prompt_data
-                ) as response:
-                    if response.status == 200:
-                        return await response.read()
-                    logger.error(f"API request failed with status {response.status}")
-                    return None
+            session = await self.ensure_session()
+            prompt_data = FormData()
+            prompt_data.add_field('prompt-text', prompt)
+            gen_url = f"{self.config.api_url}{self.config.api_methods.get('gen', '')}"
+            async with session.post(
+                gen_url,
+                data=prompt_data
+            ) as response:
+                if response.status == 200:
+                    image_file = tempfile.TemporaryFile()
+                    try:
+                        async for chunk in response.content.iter_chunked(IMAGE_CHUNK_SIZE):
+                            image_file.write(chunk)
+                    except BaseException:
+                        image_file.close()
+                        raise
+                    image_file.seek(0)
+                    return image_file
+                logger.error(f"API request failed with status {response.status}")
+                return None
         except Exception as e:
             logger.error(f"Error generating image: {e}")
             return None
@@ -244,69 +451,25 @@ class ApiClient:
         try:
             # Prepare messages for AI
             messages = [
-                {
-                    "role": "system",
-                    "content": (
-                        "You are an artificial intelligence assistant and you need to "
-                        "engage in a helpful, detailed, polite conversation with a user."
-                    ),
-                },
-                {
-                    "role": "user",
-                    "content": (
-                        "You are an AI assistant tasked with processing messages from a Telegram channel and generating Stable Diffusion prompts based on the content. Each message contains a text input. Your job is to analyze the text input and create a prompt that will create an original photo using Stable Diffusion."
-                        "You work on architecture project, keep in mind your results will be shown to final customers and architect teams."
-                        "Emphasis on lightness of structures."
-                        "You will receive a text input:"
-                        f"<text_input>{prompt}</text_input>"
-                        "Follow these steps to process the input and generate a Stable Diffusion prompt:"
-                        "1. Interpret the prompt:"
-                        "   - Identify key words, themes, or concepts mentioned in the legend."
-                        "   - Determine the mood, tone, or atmosphere suggested by the text."
-                        "2. Generate a Stable Diffusion prompt:"
-                        "   - Incorporate elements from the legend to guide the modification or enhancement of the image."
-                        "   - Use specific, descriptive language to convey the desired style, mood, and visual elements."
-                        "   - Include any relevant techniques, or references that align with the legend and original photo."
-                        "3. Refine and optimize the prompt:"
-                        "   - Ensure the prompt is clear, concise, and focused."
-                        "   - Use Stable Diffusion-friendly terminology and structure."
-                        "   - Balance faithfulness to the original photo with creative interpretation of the legend."
-                        "4. Give a title for the work you have done:"
-                        "   - the title should explain in 5-10 words what will be visible on the image."
-                        "   - the title will be used as the caption for the generated image."
-                        "   - try to be funny, but don't overthink it: you are a clown that can make serious people laugh!"
-                        "Provide your output in the following format:"
-                        "<result><analysis>"
-                        "[Your analysis of the text_input]"
-                        "</analysis>"
-                        "<stable_diffusion_prompt>"
-                        "[Your generated Stable Diffusion prompt]"
-                        "</stable_diffusion_prompt>"
-                        "<title>"
-                        "[Your generated Title for this work]"
-                        "</title></result>"
-                        "Check that the <stable_diffusion_prompt> and <title> tags are available inside the response <result> tag."
-                    ),
-                },
+                {"role": "system", "content": ENHANCE_SYSTEM_PROMPT},
+                {"role": "user", "content": ENHANCE_PROMPT_TEMPLATE.format(prompt=prompt)},
             ]
 
             # Choose which client to use based on availability
             if self.perplexity_client:
-                response = self.perplexity_client.chat.completions.create(
+                response = await self.perplexity_client.chat.completions.create(
                     model="sonar",
                     messages=messages,
                 )
                 content = response.choices[0].message.content
 
             # Extract the stable diffusion prompt
-            prompt_pattern = r'<stable_diffusion_prompt>(.*?)</stable_diffusion_prompt>'
-            prompt_match = re.search(prompt_pattern, content, re.DOTALL)
+            prompt_match = PROMPT_RE.search(content)
             if prompt_match:
                 enhanced_prompt = prompt_match.group(1).strip()
 
             # Extract the title
-            title_pattern = r'<title>(.*?)</title>'
-            title_match = re.search(title_pattern, content, re.DOTALL)
+            title_match = TITLE_RE.search(content)
             if title_match:
                 title = title_match.group(1).strip()
 
@@ -321,41 +484,27 @@ class VillaDesigner:
         self.db = db
         self.api_client = api_client
         
-        # Budget description mapping
-        self.budget_desc = {
-            "100k-200k": "budget-friendly",
-            "200k-300k": "standard",
-            "300k-500k": "premium",
-            "500k-750k": "luxury",
-            "750k-1m": "ultra-luxury",
-            "1m-plus": "elite high-end"
-        }
-        
-        # Camera angle description mapping
-        self.angle_desc = {
-            "orbit": "aerial 360-degree view around a",
-            "top-down": "top-down aerial view of a",
-            "approach": "front approach view of a",
-            "flyover": "low flyover shot of a",
-            "parallax": "parallax arc shot of a"
-        }
+        # Users whose villa generation is currently in progress
+        self._generating: Set[int] = set()
+    
+    def _build_home_markup(self, prefs: Dict[str, str]) -> InlineKeyboardMarkup:
+        """Create home screen keyboard with current values."""
+        return InlineKeyboardMarkup([
+            [InlineKeyboardButton(f"💰 Budget: ${prefs['budget']}", callback_data="edit:budget")],
+            [InlineKeyboardButton(f"📍 Location: {prefs['location']}", callback_data="edit:location")],
+            [InlineKeyboardButton(f"🎨 Style: {prefs['style']}", callback_data="edit:style")],
+            [InlineKeyboardButton(f"📷 Camera Angle: {prefs['camera_angle']}", callback_data="edit:camera_angle")],
+            GENERATE_ROW
+        ])
     
     async def show_home_screen(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Display the villa configuration home screen with current parameters and options."""
         user_id = update.effective_user.id if update and update.effective_user else context._user_id
         
         # Get current user preferences
-        prefs = self.db.get_user_preferences(user_id)
+        prefs = await self.db.get_user_preferences(user_id)
         
-        # Create home screen keyboard with current values
-        keyboard = [
-            [InlineKeyboardButton(f"💰 Budget: ${prefs['budget']}", callback_data="edit:budget")],
-            [InlineKeyboardButton(f"📍 Location: {prefs['location']}", callback_data="edit:location")],
-            [InlineKeyboardButton(f"🎨 Style: {prefs['style']}", callback_data="edit:style")],
-            [InlineKeyboardButton(f"📷 Camera Angle: {prefs['camera_angle']}", callback_data="edit:camera_angle")],
-            [InlineKeyboardButton("🔄 Generate Villa", callback_data="action:generate")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        reply_markup = self._build_home_markup(prefs)
 
         message_text = "🏝️ *Dream Villa Designer*\n\nCustomize your villa parameters and click Generate when ready!"
 
@@ -376,16 +525,68 @@ class VillaDesigner:
     
     async def start_generation(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Start the villa generation process with a home screen interface."""
-        user_id = update.effective_user.id
-        
-        # Initialize user preferences
-        self.db.update_user_step(user_id, 'home')
-        
         await self.show_home_screen(update, context)
     
+    async def _edit_status(self, query: CallbackQuery, text: str) -> None:
+        """Edit the status message, logging instead of raising on Telegram errors."""
+        try:
+            await query.edit_message_text(text=text)
+        except TelegramError as e:
+            logger.warning(f"Could not update generation status: {e}")
+    
+    async def _generate_villa(self, query: CallbackQuery, context: ContextTypes.DEFAULT_TYPE, user_id: int) -> None:
+        """Generate and send a villa image from the user's current preferences."""
+        # Ignore repeated presses while this user's villa is still being generated
+        if user_id in self._generating:
+            await query.answer(text="Your villa is already being generated...")
+            return
+        
+        self._generating.add(user_id)
+        try:
+            # Acknowledge with a toast so the user gets feedback during the LLM call
+            await query.answer(text="Generating your dream villa...")
+            
+            # Get all preferences to generate the prompt
+            prefs = await self.db.get_user_preferences(user_id)
+            
+            # Get descriptive text based on preferences
+            budget_desc = BUDGET_DESC.get(prefs['budget'], "luxury")
+            angle_desc = ANGLE_DESC.get(prefs['camera_angle'], "aerial view of a")
+            
+            # Create the base prompt
+            prompt = f"A photorealistic {angle_desc} {budget_desc} {prefs['style']} villa located at the {prefs['location']}, luxury vacation home, professional photography, high detail, 4K"
+            
+            # Enhance the prompt
+            enhanced_prompt, title = await self.api_client.enhance_prompt(prompt)
+            
+            # Generate the image while updating the message with the enhanced prompt;
+            # this is the only status edit, to stay well under Telegram's rate limits.
+            # Without reply_markup the edit also removes the stale home keyboard.
+            # A failed status edit must not discard the generated image.
+            result_image, _ = await asyncio.gather(
+                self.api_client.generate_image(enhanced_prompt),
+                self._edit_status(query, f"Generating {title}...\n\n{enhanced_prompt}")
+            )
+            
+            if result_image:
+                # Send the generated image
+                # read_file_handle=False lets the HTTP layer stream the file instead of reading it whole
+                with result_image:
+                    await context.bot.send_photo(
+                        chat_id=query.message.chat_id,
+                        photo=InputFile(result_image, filename=IMAGE_FILENAME, read_file_handle=False),
+                        caption=title
+                    )
+            else:
+                await query.message.edit_text("Sorry, there was an error generating your villa. Please try again later.")
+        finally:
+            self._generating.discard(user_id)
+    
     async def handle_button_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         query = update.callback_query
-        await query.answer()
+        # Generation answers the query itself with a status toast
+        if query.data != "action:generate":
+            await query.answer()
         
         user_id = query.from_user.id
         data = query.data.split(':')
@@ -394,123 +595,41 @@ class VillaDesigner:
         
         if action_type == 'edit':
             # User wants to edit a parameter
-            self.db.update_user_step(user_id, f"editing_{action_value}")
-            
             if action_value == 'budget':
-                # Show budget selection buttons
-                keyboard = [
-                    [InlineKeyboardButton("$100K-$200K (Budget)", callback_data="budget:100k-200k")],
-                    [InlineKeyboardButton("$200K-$300K (Standard)", callback_data="budget:200k-300k")],
-                    [InlineKeyboardButton("$300K-$500K (Premium)", callback_data="budget:300k-500k")],
-                    [InlineKeyboardButton("$500K-$750K (Luxury)", callback_data="budget:500k-750k")],
-                    [InlineKeyboardButton("$750K-$1M (Ultra-Luxury)", callback_data="budget:750k-1m")],
-                    [InlineKeyboardButton("$1M+ (Elite)", callback_data="budget:1m-plus")],
-                    [InlineKeyboardButton("« Back to Home", callback_data="action:home")]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                
                 await query.edit_message_text(
                     text="What's your budget range for the villa?",
-                    reply_markup=reply_markup
+                    reply_markup=BUDGET_MARKUP
                 )
                 
             elif action_value == 'location':
-                # Show location selection buttons
-                keyboard = [
-                    [InlineKeyboardButton("Seaside", callback_data="location:seaside")],
-                    [InlineKeyboardButton("Jungle", callback_data="location:jungle")],
-                    [InlineKeyboardButton("Mountain", callback_data="location:mountain")],
-                    [InlineKeyboardButton("Urban", callback_data="location:urban")],
-                    [InlineKeyboardButton("« Back to Home", callback_data="action:home")]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                
                 await query.edit_message_text(
                     text="Where would you like your villa to be located?",
-                    reply_markup=reply_markup
+                    reply_markup=LOCATION_MARKUP
                 )
                 
             elif action_value == 'style':
-                # Show style selection buttons
-                keyboard = [
-                    [InlineKeyboardButton("Modern", callback_data="style:modern")],
-                    [InlineKeyboardButton("Rustic/Wood", callback_data="style:rustic")],
-                    [InlineKeyboardButton("Mediterranean", callback_data="style:mediterranean")],
-                    [InlineKeyboardButton("Minimalist", callback_data="style:minimalist")],
-                    [InlineKeyboardButton("« Back to Home", callback_data="action:home")]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                
                 await query.edit_message_text(
                     text="What architectural style would you prefer for your villa?",
-                    reply_markup=reply_markup
+                    reply_markup=STYLE_MARKUP
                 )
                 
             elif action_value == 'camera_angle':
-                # Show camera angle selection buttons
-                keyboard = [
-                    [InlineKeyboardButton("Orbit (360° around property)", callback_data="camera_angle:orbit")],
-                    [InlineKeyboardButton("Top-Down (Aerial view)", callback_data="camera_angle:top-down")],
-                    [InlineKeyboardButton("Front Approach", callback_data="camera_angle:approach")],
-                    [InlineKeyboardButton("Flyover (Low pass)", callback_data="camera_angle:flyover")],
-                    [InlineKeyboardButton("Parallax Arc", callback_data="camera_angle:parallax")],
-                    [InlineKeyboardButton("« Back to Home", callback_data="action:home")]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                
                 await query.edit_message_text(
                     text="Which camera angle would you like for your villa shot?",
-                    reply_markup=reply_markup
+                    reply_markup=CAMERA_MARKUP
                 )
                 
         elif action_type == 'action':
             if action_value == 'home':
                 # Return to home screen
-                self.db.update_user_step(user_id, 'home')
                 await self.show_home_screen(update, context)
                 
             elif action_value == 'generate':
-                # Get all preferences to generate the prompt
-                prefs = self.db.get_user_preferences(user_id)
-                
-                # Get descriptive text based on preferences
-                budget_desc = self.budget_desc.get(prefs['budget'], "luxury")
-                angle_desc = self.angle_desc.get(prefs['camera_angle'], "aerial view of a")
-                
-                # Create the base prompt
-                prompt = f"A photorealistic {angle_desc} {budget_desc} {prefs['style']} villa located at the {prefs['location']}, luxury vacation home, professional photography, high detail, 4K"
-                
-                await query.edit_message_text(
-                    text=f"Generating your dream villa...\n\n{prompt}"
-                )
-                
-                # Enhance the prompt
-                enhanced_prompt, title = await self.api_client.enhance_prompt(prompt)
-                
-                # Update the message with the enhanced prompt
-                await query.edit_message_text(
-                    text=f"Generating {title}...\n\n{enhanced_prompt}"
-                )
-                
-                # Generate the image
-                result_image = await self.api_client.generate_image(enhanced_prompt)
-                
-                if result_image:
-                    # Send the generated image
-                    await context.bot.send_photo(
-                        chat_id=query.message.chat_id,
-                        photo=result_image,
-                        caption=title
-                    )
-                    
-                    await query.message.edit_text(f"Here's {title}!\n\n{enhanced_prompt}")
-                else:
-                    await query.message.edit_text("Sorry, there was an error generating your villa. Please try again later.")
+                await self._generate_villa(query, context, user_id)
         
         elif action_type in ['budget', 'location', 'style', 'camera_angle']:
             # User selected a specific value for a parameter
-            self.db.update_user_preference(user_id, action_type, action_value)
-            self.db.update_user_step(user_id, 'home')
+            await self.db.update_user_preference(user_id, action_type, action_value)
             
             # Return to home screen after setting a parameter
             await self.show_home_screen(update, context)
@@ -523,6 +642,15 @@ class DreamVillaBot:
         self.api_client = ApiClient(self.config)
         self.villa_designer = VillaDesigner(self.db, self.api_client)
     
+    async def _setup(self, application: Application) -> None:
+        """Open the database pool once the event loop is running."""
+        await self.db.setup()
+    
+    async def _shutdown(self, application: Application) -> None:
+        """Release resources held by the bot."""
+        await self.api_client.close()
+        await self.db.close()
+    
     async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Send welcome message when the command /start is issued."""
         if update.message:
@@ -537,7 +665,14 @@ class DreamVillaBot:
         """Send info message when the command /info is issued."""
         if update.message:
             reply_text = self.config.messages.get("info", "Dream Villa Bot")
-            is_online = await self.api_client.is_api_online()
+            try:
+                # Backstop only: the probe request's own timeout normally fires first
+                is_online = await asyncio.wait_for(
+                    self.api_client.is_api_online(),
+                    timeout=API_PROBE_TIMEOUT + API_PROBE_MARGIN
+                )
+            except asyncio.TimeoutError:
+                is_online = False
             
             if is_online:
                 reply_text += "\n\n✅ API service available"
@@ -559,7 +694,15 @@ class DreamVillaBot:
     def run(self):
         """Start the bot."""
         # Create the Application
-        application = Application.builder().token(self.config.bot_token).build()
+        application = (
+            Application.builder()
+            .token(self.config.bot_token)
+            # Handle updates concurrently so one user's generation doesn't block everyone else
+            .concurrent_updates(True)
+            .post_init(self._setup)
+            .post_shutdown(self._shutdown)
+            .build()
+        )
         
         # Add command handlers
         application.add_handler(CommandHandler("start", self.start_command))
@@ -580,6 +723,14 @@ class DreamVillaBot:
         application.run_polling(allowed_updates=Update.ALL_TYPES)
 
 def main():
+    # uvloop is optional and unavailable on Windows; fall back to the default loop
+    try:
+        import uvloop
+        uvloop.install()
+        logger.info("Using uvloop event loop")
+    except ImportError:
+        pass
+    
     bot = DreamVillaBot()
     bot.run()
 